@@ -1,128 +1,248 @@
 from qgis.core import *
+from qgis.PyQt.QtCore import QVariant
+import multiprocessing
 import pickle
 import networkx as nx
+import numpy as np
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 # QGIS Processing Script Parameters "##" indicates a parameter to QGIS
 ##Graph=group
 ##Vector=vector
 ##Field=field Vector
+##Output_Format=selection NetworkX graph;NumPy arrays
 ##Output_File_Path=file
 
+# Field types whose values are stored as floats. Booleans are included
+# so they keep becoming 1.0 and 0.0.
+NUMERIC_TYPES = (QVariant.Int, QVariant.UInt, QVariant.LongLong,
+                 QVariant.ULongLong, QVariant.Double, QVariant.Bool)
+
+# The Numba kernel is compiled afresh on every run, which takes about
+# 3 s. A single thread of it is slower than the NumPy version, so it
+# only pays for its compilation on large layers with several cores.
+NUMBA_MIN_VERTICES = 50000
+NUMBA_MIN_CORES = 4
 
-def rectBounds(geometry):
+
+def updateEdges(dictionary, fieldValue1, fieldValue2):
     """
-    Generates bounding rectangles for QGIS polygon geometries.
+    Updates both vertices' 'edges' sets in the dictonary.
 
-    :param geometry: A QGIS feature geometry
-    :type geometry: QgsGeometry
-    :return: A list of the lower left and upper right coordinates of
-        a bounding rectangle for the input geometry
-    :rtype: list
-    :return list entry type: float
+    :param dictionary: The graphDictionary to be updated
+    :type dictionary: dict
+    :param fieldValue*: An attribute field value
+    :type fieldValue*: str
+    :return: the updated dictionary
+    :rtype: dict
     """
-    coordList = geometry.asPolygon()
-    x = []
-    y = []
-    for i in range(len(coordList)):
-        x.append(coordList[0][i].x())
-        y.append(coordList[0][i].y())
-    return [min(x), min(y), max(x), max(y)]
+    dictionary[fieldValue1]['edges'].add(fieldValue2)
+    dictionary[fieldValue2]['edges'].add(fieldValue1)
+    return dictionary
 
 
-def filter(layer, exp):
+def overlappingPairs(bounds, blockSize=1024):
     """
-    Filters the features of a vector layer by an expression.
-
-    :param layer: A QGIS vector layer
-    :type layer: QgsVectorLayer
-    :param exp: A QGIS expression
-    :type exp: QgsExpression
-    :raises Exception: Parser Error
-    :raises ValueError:
-    :yield: features
-    :ytype: QgsFeature
+    Generates the index pairs (i, j), i < j, of overlapping rectangles.
+
+    The overlap test is vectorized over blocks of blockSize rows, each
+    compared only with the rectangles after its first row. Every block
+    holds two boolean arrays of up to blockSize * len(bounds) entries
+    at a time: the running overlap matrix and the comparison being
+    folded into it.
+
+    :param bounds: the rectangles as rows [xMin, yMin, xMax, yMax]
+    :type bounds: numpy.ndarray
+    :param blockSize: the number of rows tested at a time
+    :type blockSize: int
+    :yield: the row and column index arrays of each block
+    :ytype: tuple
     """
-    if exp.hasParserError():
-        raise Exception(exp.parserErrorString())
-    exp.prepare(layer.pendingFields())
-    for feature in layer.getFeatures():
-        value = exp.evaluate(feature)
-        if exp.hasEvalError():
-            raise ValueError(exp.evalErrorString())
-        if bool(value):
-            yield feature
-
-
-def quickFilter(layer, exp):
+    for start in range(0, len(bounds), blockSize):
+        block = bounds[start:start + blockSize]
+        rest = bounds[start + 1:]
+        overlaps = block[:, None, 0] <= rest[None, :, 2]
+        overlaps &= block[:, None, 2] >= rest[None, :, 0]
+        overlaps &= block[:, None, 1] <= rest[None, :, 3]
+        overlaps &= block[:, None, 3] >= rest[None, :, 1]
+        rows, columns = overlaps.nonzero()
+        # Column c of rest is rectangle start + 1 + c, which only comes
+        # after row r of the block when c >= r.
+        above = columns >= rows
+        yield rows[above] + start, columns[above] + start + 1
+
+
+def pairRectanglesKernel(bounds):
     """
-    Returns the first feature found satisfying the expression.
+    Numba version of pairRectangles.
 
-    This function is a copy of filter with a 'return' statement
-    in place of the 'yield' statement
+    The rows are split across threads twice: once to count the overlaps
+    of every row, and once to write each row's pairs at the offset given
+    by the running total of those counts.
 
-    :param layer: A QGIS vector layer
-    :type layer: QgsVectorLayer
-    :param exp: A QGIS expression
-    :type exp: QgsExpression
-    :raises Exception: Parser Error
-    :raises ValueError:
-    :return: feature
-    :rtype: QgsFeature
+    :param bounds: the rectangles as rows [xMin, yMin, xMax, yMax]
+    :type bounds: numpy.ndarray
+    :return: see pairRectangles
+    :rtype: tuple
     """
-    if exp.hasParserError():
-        raise Exception(exp.parserErrorString())
-    exp.prepare(layer.pendingFields())
-    for feature in layer.getFeatures():
-        value = exp.evaluate(feature)
-        if exp.hasEvalError():
-            raise ValueError(exp.evalErrorString())
-        if bool(value):
-            return feature
-
-
-def buildExpression(field, value):
+    count = bounds.shape[0]
+    rowCounts = np.zeros(count, dtype=np.int64)
+    for i in prange(count):
+        overlaps = 0
+        for j in range(i + 1, count):
+            if (bounds[i, 0] <= bounds[j, 2] and bounds[i, 2] >= bounds[j, 0]
+                    and bounds[i, 1] <= bounds[j, 3]
+                    and bounds[i, 3] >= bounds[j, 1]):
+                overlaps += 1
+        rowCounts[i] = overlaps
+
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(rowCounts)
+    total = offsets[count]
+    rows = np.empty(total, dtype=np.int64)
+    columns = np.empty(total, dtype=np.int64)
+    rectangles = np.empty((total, 4), dtype=np.float64)
+    for i in prange(count):
+        k = offsets[i]
+        for j in range(i + 1, count):
+            if (bounds[i, 0] <= bounds[j, 2] and bounds[i, 2] >= bounds[j, 0]
+                    and bounds[i, 1] <= bounds[j, 3]
+                    and bounds[i, 3] >= bounds[j, 1]):
+                rows[k] = i
+                columns[k] = j
+                rectangles[k, 0] = max(bounds[i, 0], bounds[j, 0])
+                rectangles[k, 1] = max(bounds[i, 1], bounds[j, 1])
+                rectangles[k, 2] = min(bounds[i, 2], bounds[j, 2])
+                rectangles[k, 3] = min(bounds[i, 3], bounds[j, 3])
+                k += 1
+    return rows, columns, rectangles
+
+
+if njit is not None:
+    # No cache=True: Processing execs the script source, so there is no
+    # file for Numba to cache against.
+    pairRectanglesKernel = njit(parallel=True)(pairRectanglesKernel)
+
+
+def pairRectangles(bounds):
     """
-    Constructs an expression of the form field = value.
-
-    :param field: A vector layer attribute field name
-    :type field: str
-    :param value: A value for the attribute field taken on by features
-                  in the layer
-    :return: Expression
-    :rtype: QgsExpression
+    Finds the overlapping pairs of rectangles and their intersections.
+
+    Compiling pairRectanglesKernel costs seconds on every run, so it is
+    only used when Numba is installed and both the number of rectangles
+    and the number of cores reach NUMBA_MIN_VERTICES and
+    NUMBA_MIN_CORES. Otherwise overlappingPairs is used.
+
+    :param bounds: the rectangles as rows [xMin, yMin, xMax, yMax]
+    :type bounds: numpy.ndarray
+    :return: the arrays (rows, columns, rectangles), where the kth pair
+             (rows[k], columns[k]) has rows[k] < columns[k] and its
+             intersection rectangles[k] = [xMin, yMin, xMax, yMax]
+    :rtype: tuple
+    """
+    if (njit is not None and len(bounds) >= NUMBA_MIN_VERTICES
+            and multiprocessing.cpu_count() >= NUMBA_MIN_CORES):
+        return pairRectanglesKernel(bounds)
+
+    rowBlocks = [np.empty(0, dtype=np.int64)]
+    columnBlocks = [np.empty(0, dtype=np.int64)]
+    for blockRows, blockColumns in overlappingPairs(bounds):
+        rowBlocks.append(blockRows)
+        columnBlocks.append(blockColumns)
+    rows = np.concatenate(rowBlocks)
+    columns = np.concatenate(columnBlocks)
+    rectangles = np.hstack((np.maximum(bounds[rows, :2], bounds[columns, :2]),
+                            np.minimum(bounds[rows, 2:], bounds[columns, 2:])))
+    return rows, columns, rectangles
+
+
+def intersectionTest(geometry):
     """
-    try:
-        float(value)
-        exp = field + "=" + value
-    except:
-        exp = field + "=\'" + value + "\'"
-    return QgsExpression(exp)
+    Returns a function testing whether a geometry intersects the input.
 
+    Where QGIS exposes its geometry engine, the input is prepared once
+    so that testing it against many geometries is cheaper. Otherwise
+    the function is the input's own intersects method.
 
-def updateEdges(dictionary, fieldValue1, fieldValue2):
+    :param geometry: A QGIS feature geometry
+    :type geometry: QgsGeometry
+    :return: a function taking a QgsGeometry and returning a bool
+    :rtype: function
     """
-    Updates both vertices' 'edges' lists in the dictonary.
+    if hasattr(geometry, 'constGet'):
+        unwrap = QgsGeometry.constGet
+    elif hasattr(QgsGeometry, 'createGeometryEngine'):
+        unwrap = QgsGeometry.geometry
+    else:
+        return geometry.intersects
 
-    :param dictionary: The graphDictionary to be updated
-    :type dictionary: dict
-    :param fieldValue*: An attribute field value
-    :type fieldValue*: str
-    :return: the updated dictionary
-    :rtype: dict
+    engine = QgsGeometry.createGeometryEngine(unwrap(geometry))
+    engine.prepareGeometry()
+    return lambda other: engine.intersects(unwrap(other))
+
+
+def anyIntersect(ids, index, geometries, boxes, tests):
     """
-    dictionary[fieldValue1]['edges'].append(fieldValue2)
-    dictionary[fieldValue2]['edges'].append(fieldValue1)
-    return dictionary
+    Checks whether any feature in ids intersects any feature in index.
+
+    Each feature is only tested against the features the index returns
+    for its own bounding box. Returns as soon as the first intersecting
+    pair is found, since one is enough to make the two vertices
+    adjacent. A feature's geometry is only prepared once it has more
+    than one candidate, and the prepared test is kept in tests for the
+    other vertex pairs the feature takes part in.
+
+    :param ids: a list of feature ids
+    :type ids: list
+    :param index: the spatial index of the other vertex
+    :type index: QgsSpatialIndex
+    :param geometries: the dictionary {feature.id():geometry}
+    :type geometries: dict
+    :param boxes: the dictionary {feature.id():bounding box}
+    :type boxes: dict
+    :param tests: the dictionary {feature.id():intersectionTest}, updated
+                  in place
+    :type tests: dict
+    :return: True if an intersecting pair exists
+    :rtype: bool
+    """
+    for featureId in ids:
+        candidates = index.intersects(boxes[featureId])
+        if not candidates:
+            continue
+
+        intersects = tests.get(featureId)
+        if intersects is None:
+            if len(candidates) == 1:
+                # Preparing costs more than a single plain test
+                intersects = geometries[featureId].intersects
+            else:
+                intersects = intersectionTest(geometries[featureId])
+                tests[featureId] = intersects
+
+        for candidate in candidates:
+            if intersects(geometries[candidate]):
+                return True
+    return False
 
 
 def findEdges(valueSet, boundsIndexDict, graphDict, features):
     """
     Generates the edge lists for the graphDictionary
 
-    This function does most of the heavy lifting. The nested for loops
-    are written such that after each iteration of the outer loop, the
-    inner loop shrinks. It also takes advantage of the bounding
-    rectangles and spatial indices, in order to optimize its runtime.
+    This function does most of the heavy lifting. The bounding
+    rectangles of all the vertices are compared at once with
+    pairRectangles, and only the overlapping pairs are checked
+    against the spatial indices and the feature geometries.
 
     :param valueSet: the values taken on by the input attribute field
     :type valueSet: set
@@ -135,42 +255,44 @@ def findEdges(valueSet, boundsIndexDict, graphDict, features):
     :return: the updated graphDict
     :rtype: dict
     """
-    valueSet2 = valueSet.copy()
-
-    for value1 in valueSet:
-        valueSet2.remove(value1)
+    vertices = list(valueSet)
+    allBounds = np.array([boundsIndexDict[value][0] for value in vertices],
+                         dtype=np.float64).reshape(-1, 4)
+    rows, columns, rectangles = pairRectangles(allBounds)
+    geometries = dict((featureId, feature.geometry())
+                      for featureId, feature in features.items())
+    boxes = dict((featureId, geometry.boundingBox())
+                 for featureId, geometry in geometries.items())
+    tests = {}
+
+    for i, j, small in zip(rows, columns, rectangles):
+        value1 = vertices[i]
+        value2 = vertices[j]
         index1 = boundsIndexDict[value1][1]
-        bounds = boundsIndexDict[value1][0]
-        rectangle1 = QgsRectangle(bounds[0], bounds[1], bounds[2], bounds[3])
-
-        for value2 in valueSet2:
-            index2 = boundsIndexDict[value2][1]
-            tempBounds = boundsIndexDict[value2][0]
-            rectangle2 = QgsRectangle(tempBounds[0], tempBounds[1], tempBounds[2], tempBounds[3])
-
-            if rectangle1.intersects(rectangle2):
-                rectangle3 = smallRectangle(bounds, tempBounds)
-                ids1 = index1.intersects(rectangle3)
-                ids2 = index2.intersects(rectangle3)
-                finish = False
-
-                while (finish is False):
-                    for id1 in ids1:
-                        feature1 = features[id1]
-
-                        for id2 in ids2:
-                            feature2 = features[id2]
-                            
-                            if feature2.geometry().intersects(feature1.geometry()):
-                                graphDict = updateEdges(graphDict, value1, value2)
-                                finish = True
-                    finish = True
+        index2 = boundsIndexDict[value2][1]
+
+        rectangle = QgsRectangle(small[0], small[1], small[2], small[3])
+        ids1 = index1.intersects(rectangle)
+        ids2 = index2.intersects(rectangle)
+
+        # Walk the shorter list of candidates, looking each of them up
+        # in the other vertex's index.
+        if len(ids1) <= len(ids2):
+            found = anyIntersect(ids1, index2, geometries, boxes, tests)
+        else:
+            found = anyIntersect(ids2, index1, geometries, boxes, tests)
+        if found:
+            graphDict = updateEdges(graphDict, value1, value2)
     return graphDict
 
 
 def processParameters(vector, field):
     """
     Does the initial processing of the parameters.
+
+    The layer is read exactly once. Each feature is grouped by its value
+    of the vertex field, and the bounds of every group are accumulated
+    along the way.
     
     :param vector: the vector layer to process
     :type vector: unicode
@@ -184,36 +306,73 @@ def processParameters(vector, field):
     allFeatures = {}
     layerFields = []
     graphDictionary = {}
-    fieldValues = set()
+    groups = {}
     inputLayer = processing.getObject(vector)
     for feature in inputLayer.getFeatures():
-        fieldValues.add(str(feature[Field]))
+        value = str(feature[field])
         allFeatures[feature.id()] = feature
-
-    for field in inputLayer.pendingFields():
-        layerFields.append(str(field.name()))
-
+        box = feature.geometry().boundingBox()
+
+        if value not in groups:
+            bounds = [box.xMinimum(), box.yMinimum(),
+                      box.xMaximum(), box.yMaximum()]
+            groups[value] = [bounds, []]
+        else:
+            bounds = groups[value][0]
+            bounds[0] = min(bounds[0], box.xMinimum())
+            bounds[1] = min(bounds[1], box.yMinimum())
+            bounds[2] = max(bounds[2], box.xMaximum())
+            bounds[3] = max(bounds[3], box.yMaximum())
+        groups[value][1].append(feature.id())
+
+    numericFields = []
+    for layerField in inputLayer.fields():
+        layerFields.append(str(layerField.name()))
+        numericFields.append(layerField.type() in NUMERIC_TYPES)
+
+    fieldValues = set(groups)
     for value in fieldValues:
         graphDictionary[value] = {}
-        graphDictionary[value]['edges'] = []
+        graphDictionary[value]['edges'] = set()
         
-    return [allFeatures, fieldValues, graphDictionary, layerFields, inputLayer]
+    return [allFeatures, fieldValues, graphDictionary, layerFields, inputLayer,
+            groups, numericFields]
 
 
-def boundsAndIndexDict(layer, valueSet, field):
+def buildIndex(source, featureIds):
+    """
+    Builds the spatial index of a group of features.
+
+    :param source: the feature source of the vector layer
+    :type source: QgsVectorLayerFeatureSource
+    :param featureIds: the ids of the features to index
+    :type featureIds: list
+    :return: the spatial index
+    :rtype: QgsSpatialIndex
+    """
+    # The index only needs the ids and geometries, so the provider
+    # can skip reading the attributes.
+    request = QgsFeatureRequest().setFilterFids(featureIds)
+    request.setSubsetOfAttributes([])
+    # The iterator constructor bulk loads the R-tree, which is much
+    # faster than inserting the features one at a time.
+    return QgsSpatialIndex(source.getFeatures(request))
+
+
+def boundsAndIndexDict(layer, groups):
     """
     Generates the dictionary {vertex : [bounds, spatialIndex]}
     
     The dictionary generated by this function is used to optimize the
-    findEdges() function.
+    findEdges() function. The spatial indices are independent of each
+    other, so they are built on a pool of threads where
+    concurrent.futures is available, and one after another otherwise.
 
     :param layer: A QGIS vector layer
     :type layer: QgsVectorLayer
-    :param valueSet: the set of values taken on by the attribute field
-    :type valueSet: set
-    :type valueSet elements: str
-    :param field: the attribute field
-    :param type: str
+    :param groups: the dictionary {vertex : [bounds, featureIds]} built
+                   by processParameters
+    :type groups: dict
     :return: the dictionary {vertex : [bounds, spatialIndex]}
     :rtype: dict
     :rvalues: A list whose first entry is a list and whose second entry
@@ -221,77 +380,69 @@ def boundsAndIndexDict(layer, valueSet, field):
     """
 
     boundsIndexDict = {}
-    for value in valueSet:
-        spatialIndex = QgsSpatialIndex()
-        expression = buildExpression(field, value)
-        x = []
-        y = []
-
-        for feature in filter(layer, expression):
-            geom = feature.geometry()
-            spatialIndex.insertFeature(feature)
-            featureBounds = rectBounds(geom)
-            x.extend([featureBounds[0], featureBounds[2]])
-            y.extend([featureBounds[1], featureBounds[3]])
-
-        boundsIndexDict[value] = [[min(x), min(y), max(x), max(y)], spatialIndex]
+    if ThreadPoolExecutor is None:
+        source = QgsVectorLayerFeatureSource(layer)
+        for value, (bounds, featureIds) in groups.items():
+            boundsIndexDict[value] = [bounds, buildIndex(source, featureIds)]
+        return boundsIndexDict
+
+    # A feature source may be handed to another thread, but iterators
+    # must not be opened on the same source from several threads at
+    # once. Each group gets its own source, created on this thread.
+    workers = multiprocessing.cpu_count()
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for value, (bounds, featureIds) in groups.items():
+            source = QgsVectorLayerFeatureSource(layer)
+            futures[value] = executor.submit(buildIndex, source, featureIds)
+
+    for value, future in futures.items():
+        boundsIndexDict[value] = [groups[value][0], future.result()]
 
     return boundsIndexDict
 
 
-def addAttributesDict(layer, vertexField, layerFields, graphDictionary):
+def addAttributesDict(layerFields, numericFields, graphDictionary, features,
+                      groups):
     """
     Adds an attributes dictionary to the graph dictionary for each vertex.
 
     The attributes dictionary has the form {field: fieldValue} for 
     every field in the attributes table of the vector layer. The
-    fieldValues come from the feature returned by quickFilter.
+    fieldValues come from the first feature read from the layer that
+    takes on the vertex's value. Values of numeric and boolean fields
+    are stored as floats, and all other values, including NULL, as
+    strings.
     
-    :param layer: A QGIS vector Layer
-    :type layer: QgsVectorLayer
-    :param vertexField: A vector layer attributes field
-    :type vertexField: str
     :param layerFields: a list of the vector layer attribute fields
     :type layerFields: list
+    :param numericFields: whether each of the layerFields is numeric
+    :type numericFields: list
     :param graphDictionary: The dictionary {vertex : dict}
     :type graphDictionary: dict
+    :param features: the dictionary {feature.id():feature}
+    :type features: dict
+    :param groups: the dictionary {vertex : [bounds, featureIds]} built
+                   by processParameters
+    :type groups: dict
     :return: graphDictionary updated with an attributes dictionary for
              every vertex
     :rtype: dict
     """
-    for key in graphDictionary:
-        expression = buildExpression(vertexField, key)
-        featureInstance = quickFilter(layer, expression)
+    for key, (bounds, featureIds) in groups.items():
+        attributes = features[featureIds[0]].attributes()
         attributesDictionary = {}
-        for field in layerFields:
-            try:
-                attributesDictionary[field] = float(featureInstance[field])
-            except:
-                try:
-                    attributesDictionary[field] = str(featureInstance[field])
-                except:
-                    pass
+        for index, (field, numeric) in enumerate(zip(layerFields,
+                                                     numericFields)):
+            value = attributes[index]
+            if numeric and value != NULL:
+                attributesDictionary[field] = float(value)
+            else:
+                attributesDictionary[field] = str(value)
         graphDictionary[key]['attributes'] = attributesDictionary
     return graphDictionary
 
 
-def smallRectangle(bounds1, bounds2):
-    """
-    Generates the rectangle bounded by the intersection of the parameters
-
-    :param bounds*: A list of bounds, [xMin, yMin, xMax, yMax]
-    :type bounds*: list
-    :type bounds* elements: float
-    :return: A QGIS Rectangle
-    :rtype: QgsRectangle
-    """
-    xMin = max(bounds1[0], bounds2[0])
-    yMin = max(bounds1[1], bounds2[1])
-    xMax = min(bounds1[2], bounds2[2])
-    yMax = min(bounds1[3], bounds2[3])
-    return QgsRectangle(xMin, yMin, xMax, yMax)
-
-
 def buildGraph(vector, field):
     """
     Builds the graph as a dictionary
@@ -305,8 +456,9 @@ def buildGraph(vector, field):
     :type vector: unicode
     :param field: the QGIS parameter Field
     :type field: str
-    :return: The graph
-    :rtype: dict
+    :return: the graph, the vector layer attribute fields, and whether
+             each of those fields is numeric
+    :rtype: list
     """
     parameters = processParameters(vector, field)
     allFeatures = parameters[0]
@@ -314,10 +466,15 @@ def buildGraph(vector, field):
     graphDict = parameters[2]
     layerFields = parameters[3]
     layer = parameters[4]
-    bdsIdxDict = boundsAndIndexDict(layer, fieldValues, field)
+    groups = parameters[5]
+    numericFields = parameters[6]
+    bdsIdxDict = boundsAndIndexDict(layer, groups)
     graphDict = findEdges(fieldValues, bdsIdxDict, graphDict, allFeatures)
-    graphDict = addAttributesDict(layer, field, layerFields, graphDict)
-    return graphDict
+    graphDict = addAttributesDict(layerFields, numericFields, graphDict,
+                                  allFeatures, groups)
+    for data in graphDict.values():
+        data['edges'] = sorted(data['edges'])
+    return [graphDict, layerFields, numericFields]
 
 
 def nxGraph(graphDict):
@@ -331,41 +488,76 @@ def nxGraph(graphDict):
     """
 
     graph = nx.Graph()
-    for vertex, data in graphDict.iteritems():
-        graph.add_node(vertex)
-        edgeList = nxEdgeTuples(vertex, data['edges'])
-        graph.add_edges_from(edgeList)
-        graph.node[vertex]['attributes'] = data['attributes']
+    graph.add_nodes_from((vertex, {'attributes': data['attributes']})
+                         for vertex, data in graphDict.items())
+    # graphDict stores every edge under both of its vertices
+    graph.add_edges_from((vertex, neighbor)
+                         for vertex, data in graphDict.items()
+                         for neighbor in data['edges'] if vertex < neighbor)
 
     return graph
 
 
-def nxEdgeTuples(vertex, edgeList):
+def arrayGraph(graphDict, layerFields, numericFields):
     """
-    Generates the list [(vertex, neighbor1), (vertex, neighbor2),...]
-    
-    :param vertex: A vertex in the graph
-    :type vertex: str
-    :param edgeList: A list of the vertex's neighbors
-    :type edgeList: list
-    :return: a list of edges as tuples
-    :rtype: list 
+    Transforms a graphDict into a dictionary of NumPy arrays
+
+    The vertices are numbered in sorted order. The edges are stored in
+    compressed sparse row form: the neighbors of vertex i are
+    vertices[indices[indptr[i]:indptr[i + 1]]]. Each attribute field is
+    one array ordered like vertices. Numeric fields are float arrays,
+    with NULL stored as NaN, and all other fields are object arrays.
+
+    :param graphDict: Graph data stored as a dictionary
+    :type graphDict: dict
+    :param layerFields: a list of the vector layer attribute fields
+    :type layerFields: list
+    :param numericFields: whether each of the layerFields is numeric
+    :type numericFields: list
+    :return: the dictionary {'vertices': array, 'indptr': array,
+             'indices': array, 'attributes': {field: array}}
+    :rtype: dict
     """
-    edgeTuples = []
-    for edge in edgeList:
-        edgeTuples.append((vertex, edge))
-    return edgeTuples
+    vertices = sorted(graphDict)
+    vertexIds = dict((vertex, i) for i, vertex in enumerate(vertices))
+
+    indptr = np.zeros(len(vertices) + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(graphDict[vertex]['edges'])
+                            for vertex in vertices])
+    indices = np.fromiter((vertexIds[neighbor] for vertex in vertices
+                           for neighbor in graphDict[vertex]['edges']),
+                          dtype=np.int32, count=int(indptr[-1]))
+
+    attributes = {}
+    for field, numeric in zip(layerFields, numericFields):
+        values = [graphDict[vertex]['attributes'][field]
+                  for vertex in vertices]
+        if numeric:
+            # addAttributesDict stores numeric NULLs as strings
+            attributes[field] = np.array(
+                [value if isinstance(value, float) else np.nan
+                 for value in values], dtype=np.float64)
+        else:
+            attributes[field] = np.array(values, dtype=object)
+
+    return {'vertices': np.array(vertices, dtype=object),
+            'indptr': indptr,
+            'indices': indices,
+            'attributes': attributes}
 
 
 def pickleDump(path, data):
     with open(path, 'wb') as f:
-        pickle.dump(data, f)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 
-def runInputs(vector, field, path):
-    graph = buildGraph(vector, field)
-    graph = nxGraph(graph)
+def runInputs(vector, field, outputFormat, path):
+    graph, layerFields, numericFields = buildGraph(vector, field)
+    if outputFormat == 1:
+        graph = arrayGraph(graph, layerFields, numericFields)
+    else:
+        graph = nxGraph(graph)
     pickleDump(path, graph)
 
 
-runInputs(Vector, Field, Output_File_Path) # runs the script
+runInputs(Vector, Field, Output_Format, Output_File_Path) # runs the script